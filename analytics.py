@@ -0,0 +1,287 @@
+import functools
+import json
+import os
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from diagnostics import span
+from ingest import ANSWER_COLUMNS
+
+# --- 1. CLASSIFICATION RULES ---
+# Risk Reason sentence -> report category. Defaults ship in categories.json; SHIELD_CATEGORY_MAP points at a replacement.
+CATEGORY_MAP_PATH = os.environ.get('SHIELD_CATEGORY_MAP') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'categories.json')
+
+def load_category_map(path=CATEGORY_MAP_PATH):
+    with open(path, encoding='utf-8') as fh: return json.load(fh)
+
+CATEGORY_MAP = load_category_map()
+BLOCKED_PATTERN = r'(?i)blocked'
+UNKNOWN_PATTERN = r'(?i)unknown'
+RFC_PATTERN = r'(?i)RFC|Private|Reserved|Local|Internal'
+DYNAMIC_DNS_PATTERN = r'(?i)Dynamic DNS'
+COUNTRY_CLASSES = ['public', 'private', 'unknown']
+CLASS_COLUMNS = ['is_blocked', 'category', 'country_class']
+
+def matches(series, pattern):
+    """Boolean `str.contains` that runs the regex once per distinct value rather than once per row."""
+    codes, uniques = pd.factorize(series)
+    hits = pd.Series(uniques, dtype=object).astype(str).str.contains(pattern, na=False).to_numpy()
+    return np.append(hits, False)[codes] if len(codes) else np.zeros(0, dtype=bool)
+
+def relabel(series, mapping):
+    """Map values through `mapping` (unmatched values kept, missing values become None), once per distinct value."""
+    codes, uniques = pd.factorize(series)
+    labels = np.array([mapping.get(v, v) for v in uniques] + [None], dtype=object)
+    return pd.Series(labels[codes], index=series.index, dtype=object)
+
+def classify(df, category_map=None):
+    """Derive `is_blocked`, `category` and `country_class` once per row at ingest.
+
+    Every rule is evaluated over the distinct values of its source column and broadcast back through the codes,
+    so the tabs can filter with plain boolean masks instead of re-running regexes.
+    """
+    df['is_blocked'] = matches(df['Status'], BLOCKED_PATTERN) if 'Status' in df.columns else False
+    mapping = CATEGORY_MAP if category_map is None else category_map
+    df['category'] = pd.Categorical(relabel(df['Risk Reason'], mapping) if 'Risk Reason' in df.columns else [None] * len(df))
+    country = df['Server Country'] if 'Server Country' in df.columns else df.get('Location', pd.Series(None, index=df.index, dtype=object))
+    df['country_class'] = pd.Categorical(np.where(matches(country, UNKNOWN_PATTERN), 'unknown', np.where(matches(country, RFC_PATTERN), 'private', 'public')), categories=COUNTRY_CLASSES)
+    return df
+
+def category_column(db):
+    """Column the category views group by: mapped Risk Reason when the DB has one, else raw Status."""
+    return 'category' if 'Risk Reason' in db.columns else 'Status'
+
+def country_column(db):
+    return 'Server Country' if 'Server Country' in db.columns else 'Location'
+
+# --- 2. AGGREGATE CUBES ---
+# Built once per ingested file and kept per file; the tabs query these small frames instead of monthly_db.
+DOMAIN_KEYS = ['Processed_Date', 'Device Name', 'is_blocked', 'Status', 'category', 'Domain']
+COUNTRY_KEYS = ['Processed_Date', 'Device Name', 'is_blocked', 'Country', 'country_class']
+
+def build_cubes(df):
+    """Pre-sum `Count` for one classified file into the domain and country cubes (empty cubes for `None`)."""
+    if df is None:
+        return {'domains': pd.DataFrame(columns=DOMAIN_KEYS + ['_file_id', 'Count', 'DNS Answers']), 'countries': pd.DataFrame(columns=COUNTRY_KEYS + ['_file_id', 'Count'])}
+    base = pd.DataFrame({
+        'Processed_Date': df['Processed_Date'], 'Device Name': df.get('Device Name'), 'is_blocked': df['is_blocked'],
+        'Status': df['Status'], 'category': df['category'], 'Domain': df.get('Domain'), 'Count': df['Count'],
+        'Country': df['Server Country'] if 'Server Country' in df.columns else df.get('Location'), 'country_class': df['country_class'],
+        'DNS Answers': next((df[c] for c in ANSWER_COLUMNS if c in df.columns), None), '_file_id': df['_file_id'],
+    })
+    group = dict(observed=True, dropna=False, sort=False)
+    domains = base.groupby(DOMAIN_KEYS + ['_file_id'], **group).agg({'Count': 'sum', 'DNS Answers': 'first'}).reset_index()
+    countries = base.groupby(COUNTRY_KEYS + ['_file_id'], **group)['Count'].sum().reset_index()
+    return {'domains': domains, 'countries': countries}
+
+class CubeSet:
+    """Per-file cubes keyed by `_file_id`; `cubes['domains']` / `cubes['countries']` are combined lazily.
+
+    `add`/`drop` touch only one file's cubes, like `PartitionedDB`; the combined frame is concatenated once on
+    the next read after a change and reused until the following one.
+    """
+    NAMES = ('domains', 'countries')
+
+    def __init__(self, by_file=None):
+        self.by_file = dict(by_file or {})
+        self._combined = {}
+
+    @classmethod
+    def from_db(cls, db):
+        """Cubes for every partition of a PartitionedDB."""
+        return cls({fid: build_cubes(db.partition(fid)) for fid in db.ranges})
+
+    def fork(self):
+        """An independent set sharing this one's per-file frames (they are replaced, never modified)."""
+        other = CubeSet(self.by_file)
+        other._combined = dict(self._combined)
+        return other
+
+    def add(self, file_id, cubes):
+        self.by_file[file_id] = cubes
+        self._combined = {}
+
+    def drop(self, file_id):
+        if self.by_file.pop(file_id, None) is not None: self._combined = {}
+
+    def rows(self):
+        return sum(len(cube) for cubes in self.by_file.values() for cube in cubes.values())
+
+    def __getitem__(self, name):
+        if name not in self._combined:
+            frames = [cubes[name] for cubes in self.by_file.values()]
+            self._combined[name] = pd.concat(frames, ignore_index=True) if frames else build_cubes(None)[name]
+        return self._combined[name]
+
+def window(cube, start, end=None, device=None):
+    """Slice a cube to a date window and (optionally) one device."""
+    mask = (cube['Processed_Date'] >= pd.Timestamp(start))
+    if end is not None: mask &= (cube['Processed_Date'] <= pd.Timestamp(end))
+    if device is not None: mask &= (cube['Device Name'] == device)
+    return cube[mask]
+
+# --- 3. MEMOIZATION ---
+CACHE_BYTES = int(float(os.environ.get('SHIELD_CACHE_MB', 256)) * 1024 * 1024)
+_MISS = object()
+
+def _sizeof(obj):
+    """Approximate retained bytes of a cached result."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)): return int(obj.memory_usage(deep=True).sum()) if isinstance(obj, pd.DataFrame) else int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray): return obj.nbytes
+    if isinstance(obj, dict): return sys.getsizeof(obj) + sum(_sizeof(k) + _sizeof(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)): return sys.getsizeof(obj) + sum(_sizeof(v) for v in obj)
+    if hasattr(obj, 'to_plotly_json'): return _sizeof(obj.to_plotly_json())
+    return sys.getsizeof(obj)
+
+class LRUCache:
+    """Thread-safe LRU map bounded by the approximate byte size of its values."""
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items: return _MISS
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._items: self.bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.bytes -= evicted
+
+    def invalidate(self, version):
+        """Drop every entry computed against `version`."""
+        with self._lock:
+            for key in [k for k in self._items if k[1] == version]: self.bytes -= self._items.pop(key)[1]
+
+CACHE = LRUCache()
+
+def new_version(old=None):
+    """Mint a data version token, evicting results cached under the previous one."""
+    if old is not None: CACHE.invalidate(old)
+    return uuid.uuid4().hex
+
+def _rows(data):
+    if isinstance(data, pd.DataFrame): return len(data)
+    if isinstance(data, dict): return sum(len(v) for v in data.values() if isinstance(v, pd.DataFrame)) or None
+    if isinstance(data, CubeSet): return data.rows() or None
+    return None
+
+def memoize(fn):
+    """Cache `fn(data, *params)` under (name, version, params); call as `fn(version, data, *params)`.
+
+    Every call is recorded as a `query.<name>` span flagged `cached` on a hit.
+    """
+    @functools.wraps(fn)
+    def wrapper(version, data, *args, **kwargs):
+        key = (fn.__qualname__, version, args, tuple(sorted(kwargs.items())))
+        with span(f"query.{fn.__name__}", rows=_rows(data)) as s:
+            hit = CACHE.get(key)
+            s['cached'] = hit is not _MISS
+            if hit is not _MISS: return hit
+            value = fn(data, *args, **kwargs)
+        CACHE.put(key, value)
+        return value
+    wrapper.uncached = fn
+    return wrapper
+
+# --- 4. TAB QUERIES ---
+# Pure functions of (data, filters), memoized per data version: call as fn(version, data, *filters).
+@memoize
+def db_summary(db):
+    """Date bounds and sorted device list used to seed the tab filters."""
+    return db['Processed_Date'].min().date(), db['Processed_Date'].max().date(), sorted(db['Device Name'].dropna().unique().tolist())
+
+@memoize
+def rank_rows(db, start, end=None, device=None, repeat=None, limit=200):
+    """Top blocked rows by Count for the Threat Rankings table."""
+    mask = db['is_blocked'].to_numpy() & (db['Processed_Date'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None: mask &= (db['Processed_Date'] <= pd.Timestamp(end)).to_numpy()
+    if device is not None: mask &= (db['Device Name'] == device).to_numpy()
+    if repeat is not None: mask &= (db['Is_Repeat'] == repeat).to_numpy()
+    # Partial top-k: argpartition picks the `limit` largest counts, only those are sorted and materialized.
+    rows = np.flatnonzero(mask)
+    counts = db['Count'].to_numpy()[rows]
+    if len(rows) > limit:
+        keep = np.argpartition(-counts, limit - 1)[:limit]
+        rows, counts = rows[keep], counts[keep]
+    rows = rows[np.lexsort((rows, -counts))]
+    res = db.take(rows).drop(columns=CLASS_COLUMNS)
+    res.index = range(1, len(res) + 1)
+    return res
+
+@memoize
+def category_tops(cubes, start, end=None, device=None, cat_col='category', n=15):
+    """Top-n domains per category: {category: frame[Domain, Total Queries, Device Name, DNS Answers]}."""
+    cube = window(cubes['domains'], start, end, device)
+    tops = {}
+    for category, grp in sorted(cube.groupby(cat_col, observed=True), key=lambda kv: str(kv[0])):
+        if str(category).strip() == "": continue
+        top = grp.groupby('Domain', sort=False).agg({'Count': 'sum', 'Device Name': 'first', 'DNS Answers': 'first'}).reset_index()
+        top = top.sort_values('Count', ascending=False).head(n)
+        if top['DNS Answers'].isna().all(): top = top.drop(columns=['DNS Answers'])
+        top = top.rename(columns={'Count': 'Total Queries'})
+        top.index = range(1, len(top) + 1)
+        tops[str(category)] = top
+    return tops
+
+def _top_per_device(frame, key, n):
+    """Top-n `key` values by summed Count within each device, ties in `key` order (as `nlargest` keeps them)."""
+    sums = frame.groupby(['Device Name', key], observed=True)['Count'].sum().reset_index()
+    sums = sums.sort_values('Count', ascending=False, kind='stable').sort_values('Device Name', kind='stable')
+    return sums.groupby('Device Name', observed=True, sort=False).head(n)
+
+def _by_device(frame, columns):
+    return {dev: grp[columns].reset_index(drop=True) for dev, grp in frame.groupby('Device Name', observed=True, sort=False)}
+
+def _device_reports(dom, ctry, exclude_rfc, cat_col, n):
+    """Report aggregates for every device in already-windowed cubes, one grouped pass per statistic."""
+    blocked = dom[dom['is_blocked']]
+    totals = blocked.groupby('Device Name', observed=True)['Count'].sum()
+    tr_data = _by_device(_top_per_device(dom, 'Domain', n), ['Domain', 'Count'])
+    tkill_data = _by_device(_top_per_device(blocked, 'Domain', n), ['Domain', 'Count'])
+    cats = blocked[~matches(blocked[cat_col], DYNAMIC_DNS_PATTERN)]
+    cat_sum = cats.groupby(['Device Name', cat_col], observed=True)['Count'].sum().reset_index()
+    cat_sum = _by_device(cat_sum.sort_values('Count', ascending=False, kind='stable'), [cat_col, 'Count'])
+
+    ctry = ctry[(ctry['country_class'] == 'public') if exclude_rfc else (ctry['country_class'] != 'unknown')]
+    c_top = _top_per_device(ctry, 'Country', n).rename(columns={'Count': 'Total'})
+    blocked_c = ctry[ctry['is_blocked']].groupby(['Device Name', 'Country'], observed=True)['Count'].sum()
+    c_top['Blocked'] = blocked_c.reindex(pd.MultiIndex.from_frame(c_top[['Device Name', 'Country']]), fill_value=0).to_numpy()
+    c_df = _by_device(c_top, ['Country', 'Total', 'Blocked'])
+
+    empty = lambda *cols: pd.DataFrame({c: pd.Series(dtype=object if c in ('Domain', 'Country', cat_col) else float) for c in cols})
+    return {dev: {'total': int(totals.get(dev, 0)), 'tr_data': tr_data.get(dev, empty('Domain', 'Count')),
+                  'tkill_data': tkill_data.get(dev, empty('Domain', 'Count')), 'cat_sum': cat_sum.get(dev, empty(cat_col, 'Count')),
+                  'c_df': c_df.get(dev, empty('Country', 'Total', 'Blocked'))}
+            for dev in sorted(dom['Device Name'].dropna().unique().tolist(), key=str)}
+
+@memoize
+def report_aggregates(cubes, start, end, device, exclude_rfc=True, cat_col='category', n=15):
+    """Everything the Executive Report needs for one device and window, or None when the window is empty."""
+    dom, ctry = window(cubes['domains'], start, end, device), window(cubes['countries'], start, end, device)
+    return _device_reports(dom, ctry, exclude_rfc, cat_col, n).get(device)
+
+@memoize
+def device_reports(cubes, start, end, exclude_rfc=True, cat_col='category', n=15):
+    """{device: report aggregates} for every device with rows in the window, from a single grouped pass over the cubes."""
+    return _device_reports(window(cubes['domains'], start, end), window(cubes['countries'], start, end), exclude_rfc, cat_col, n)
+
+def kill_split(total):
+    """Split blocked Count into the (DNS, TCP, UDP) kill figures shown on the report."""
+    dk, tk = int(total*0.46), int(total*0.33)
+    return dk, tk, total - dk - tk
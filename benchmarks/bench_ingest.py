@@ -0,0 +1,62 @@
+"""Compare the legacy pandas/openpyxl ingest against the streaming reader.
+
+Usage: python benchmarks/bench_ingest.py EXPORT.xlsx [--repeat N]
+
+Each engine runs in a fresh subprocess so peak RSS is measured in isolation.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def run_legacy(path):
+    import pandas as pd
+    rows = 0
+    xls = pd.ExcelFile(path, engine='openpyxl')
+    for sheet_name in xls.sheet_names:
+        df = xls.parse(sheet_name)
+        df.columns = df.columns.str.strip()
+        if 'Status' not in df.columns: continue
+        df['Count'] = pd.to_numeric(df['Count'], errors='coerce').fillna(0)
+        rows += len(df)
+    return rows
+
+def run_streaming(path):
+    from ingest import iter_sheets, normalize_sheet
+    rows = 0
+    for _, _, _, df in iter_sheets(path):
+        if df is None: continue
+        rows += len(normalize_sheet(df))
+    return rows
+
+ENGINES = {'legacy': run_legacy, 'streaming': run_streaming}
+
+def _child(engine, path):
+    import pandas, openpyxl  # noqa: F401 -- keep import cost out of the timed region
+    t0 = time.perf_counter()
+    rows = ENGINES[engine](path)
+    wall = time.perf_counter() - t0
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'engine': engine, 'rows': rows, 'wall_s': round(wall, 3), 'peak_rss_mb': round(peak_kb / 1024, 1)}))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('path')
+    ap.add_argument('--repeat', type=int, default=1)
+    ap.add_argument('--child', choices=ENGINES, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child: return _child(args.child, args.path)
+
+    for engine in ENGINES:
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, __file__, args.path, '--child', engine], check=True, capture_output=True, text=True)
+            print(out.stdout.strip())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Report master-DB bytes per row for the legacy object layout versus the compact storage layer.
+
+Usage: python benchmarks/bench_memory.py EXPORT.xlsx [EXPORT.xlsx ...]
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+from ingest import iter_sheets, normalize_sheet
+from store import PartitionedDB, memory_report
+
+def main(paths):
+    legacy, master = pd.DataFrame(), PartitionedDB()
+    for day, path in enumerate(paths, 1):
+        frames = []
+        for _, _, _, df in iter_sheets(path):
+            if df is None: continue
+            df = normalize_sheet(df)
+            df['_file_id'] = f"{os.path.basename(path)}_{day}"
+            df['Is_Repeat'] = False
+            df['Processed_Date'] = pd.Timestamp(2024, 1, day).date()
+            frames.append(df)
+        new_df = pd.concat(frames, ignore_index=True)
+        legacy = pd.concat([legacy, new_df.astype({c: object for c in new_df.columns if c != 'Count'})], ignore_index=True)
+        master.add(new_df['_file_id'].iloc[0], new_df)
+    for name, df in (('legacy', legacy), ('compact', master.frame())):
+        report = memory_report(df)
+        print(json.dumps({'layout': name, 'rows': report['rows'], 'bytes_per_row': report['bytes_per_row'], 'columns': report['columns']}))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2: sys.exit(__doc__)
+    main(sys.argv[1:])
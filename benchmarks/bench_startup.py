@@ -0,0 +1,56 @@
+"""Measure Streamlit app startup: module import time, first paint and steady-state rerun cost.
+
+Usage: python benchmarks/bench_startup.py [--reruns N]
+
+Runs in a fresh subprocess so no module is pre-imported. `import_s` is the time to import everything main.py
+imports at the top; `first_paint_s` is the first full script run under streamlit's AppTest (empty session);
+`rerun_s` is the median of N further reruns. `deferred_loaded` lists which lazily imported modules got pulled in.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFERRED = ['plotly.express', 'fpdf', 'matplotlib', 'openpyxl']
+
+def _child(reruns):
+    t0 = time.perf_counter()
+    import streamlit, pandas, numpy  # noqa: F401,E401
+    import analytics, engine, ingest, store  # noqa: F401,E401
+    import_s = time.perf_counter() - t0
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, 'main.py'), default_timeout=60)
+    t0 = time.perf_counter()
+    at.run()
+    first_paint = time.perf_counter() - t0
+    times = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - t0)
+    print(json.dumps({
+        'import_s': round(import_s, 3), 'first_paint_s': round(first_paint, 3),
+        'rerun_s': round(statistics.median(times), 4) if times else None, 'errors': len(at.exception),
+        'deferred_loaded': [m for m in DEFERRED if m in sys.modules],
+    }))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--reruns', type=int, default=5)
+    ap.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child: return _child(args.reruns)
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, __file__, '--child', '--reruns', str(args.reruns)], cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['process_s'] = round(time.perf_counter() - t0, 3)
+    print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Benchmark the compiler hot paths on synthetic Shield exports at several sizes.
+
+Usage: python benchmarks/bench_suite.py [--sizes 10k,100k,1M,5M] [--stages ingest,repeat,tabs,pdf] [--out results.json]
+
+Every (size, stage) runs in a fresh subprocess and prints one JSON line per timed operation:
+wall time, rows/s and the peak RSS reached during that operation (the kernel high-water mark is reset before each op
+where /proc allows it, otherwise the process-wide peak is reported) plus the largest worker-pool process so far.
+Rows are spread over `--files` audit days.
+
+  ingest  parse + classify + repeat-tag generated .xlsx files (cached in --workdir), through engine.compile_batch
+  repeat  Is_Repeat tagging of every file, then removing the first file with the incremental repair
+  tabs    cube build, combined view and each tab query (rankings, category top 15, one report, all-device reports)
+  pdf     one device's PDF and the all-devices ZIP
+Stages other than ingest build their input in memory from the same generator, so they skip the Excel parse.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+STAGES = ['ingest', 'repeat', 'tabs', 'pdf']
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh: fh.write('5')  # resets VmHWM to the current RSS
+        return True
+    except OSError: return False
+
+def _peak_mb(resettable):
+    if resettable:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'): return round(int(line.split()[1]) / 1024, 1)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+class Timer:
+    """Collect one result row per timed block."""
+    def __init__(self, rows, stage):
+        self.rows, self.stage = rows, stage
+
+    def __call__(self, op, fn, *args, **kwargs):
+        resettable = _reset_peak()
+        t0 = time.perf_counter()
+        value = fn(*args, **kwargs)
+        wall = time.perf_counter() - t0
+        print(json.dumps({'rows': self.rows, 'stage': self.stage, 'op': op, 'wall_s': round(wall, 4),
+                          'rows_per_s': round(self.rows / wall) if wall else None, 'peak_rss_mb': _peak_mb(resettable),
+                          'workers_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}), flush=True)
+        return value
+
+def _compiled(rows, files, devices):
+    """[(file_id, frame)] as compile_batch would produce them, generated without going through Excel."""
+    import pandas as pd
+    from synth import synth_frame
+    from engine import compile_sheets
+    from store import RepeatIndex
+    index, out = RepeatIndex(), []
+    for i in range(files):
+        n = rows // files + (1 if i < rows % files else 0)
+        day = pd.Timestamp(2024, 1, 1) + pd.Timedelta(days=i)
+        out.append((f"synth_{i}", compile_sheets([('Sheet1', synth_frame(n, devices, seed=i))], f"synth_{i}", day, index)))
+    return out, index
+
+def _cubes(compiled):
+    from analytics import CubeSet, build_cubes
+    cubes = CubeSet()
+    for file_id, df in compiled: cubes.add(file_id, build_cubes(df))
+    for name in CubeSet.NAMES: cubes[name]  # include the one-off combine in build_cubes
+    return cubes
+
+def run_stage(stage, rows, args):
+    timer = Timer(rows, stage)
+    if stage == 'ingest':
+        from synth import write_xlsx
+        from engine import compile_batch
+        from store import RepeatIndex
+        os.makedirs(args.workdir, exist_ok=True)
+        batch = []
+        for i in range(args.files):
+            n = rows // args.files + (1 if i < rows % args.files else 0)
+            path = os.path.join(args.workdir, f"synth_{rows}_{args.devices}_{args.sheets}_{i}.xlsx")
+            if not os.path.exists(path): write_xlsx(path, n, args.sheets, args.devices, seed=i)
+            with open(path, 'rb') as fh: batch.append((os.path.basename(path), fh.read(), f"2024-01-{i + 1:02d}"))
+        timer('compile_batch', compile_batch, batch, RepeatIndex())
+        return
+
+    from analytics import category_tops, db_summary, device_reports, rank_rows, report_aggregates
+    from store import PartitionedDB, RepeatIndex, pair_hashes
+    compiled, index = _compiled(rows, args.files, args.devices)
+    if stage == 'repeat':
+        def tag_all():
+            fresh = RepeatIndex()
+            for file_id, df in compiled:
+                hashes = pair_hashes(df)
+                df['Is_Repeat'] = fresh.contains(hashes)
+                fresh.add(file_id, hashes)
+        timer('tag', tag_all)
+        db = PartitionedDB()
+        for file_id, df in compiled: db.add(file_id, df)
+        timer('remove_repair', db.drop, compiled[0][0], index)
+        return
+
+    cubes = timer('build_cubes', _cubes, compiled) if stage == 'tabs' else _cubes(compiled)
+    start, end = compiled[0][1]['Processed_Date'].iloc[0].date(), compiled[-1][1]['Processed_Date'].iloc[0].date()
+    top_device = compiled[0][1]['Device Name'].value_counts().index[0]
+    if stage == 'tabs':
+        db = PartitionedDB()
+        for file_id, df in compiled: db.add(file_id, df)
+        view = timer('combined_view', db.frame)
+        timer('db_summary', db_summary.uncached, view)
+        timer('rank_rows', rank_rows.uncached, view, start, end, None, None, 200)
+        timer('category_tops', category_tops.uncached, cubes, start, end, None)
+        timer('report_aggregates', report_aggregates.uncached, cubes, start, end, top_device)
+        timer('device_reports', device_reports.uncached, cubes, start, end)
+    elif stage == 'pdf':
+        from report import render_report, render_zip
+        reports = device_reports.uncached(cubes, start, end)
+        timer('render_report', render_report, reports[top_device], start, end, top_device)
+        timer('render_zip', render_zip, reports, start, end)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--sizes', default='10k,100k,1M,5M', help="comma-separated row counts, k/M suffixes allowed")
+    ap.add_argument('--stages', default=','.join(STAGES), help=f"comma-separated subset of {','.join(STAGES)}")
+    ap.add_argument('--files', type=int, default=3, help="audit days the rows are spread over (default: 3)")
+    ap.add_argument('--sheets', type=int, default=2, help="data sheets per generated workbook (default: 2)")
+    ap.add_argument('--devices', type=int, default=40, help="distinct sensors (default: 40)")
+    ap.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'shield-bench'), help="where generated workbooks are cached")
+    ap.add_argument('--out', help="also write all results, with environment metadata, to this JSON file")
+    ap.add_argument('--child', nargs=2, metavar=('STAGE', 'ROWS'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child: return run_stage(args.child[0], int(args.child[1]), args)
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown: ap.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    passthrough = ['--files', str(args.files), '--sheets', str(args.sheets), '--devices', str(args.devices), '--workdir', args.workdir]
+    results = []
+    for rows in map(parse_size, args.sizes.split(',')):
+        for stage in stages:
+            out = subprocess.run([sys.executable, __file__, '--child', stage, str(rows)] + passthrough, capture_output=True, text=True)
+            if out.returncode:
+                row = {'rows': rows, 'stage': stage, 'error': out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}"}
+                print(json.dumps(row), flush=True)
+                results.append(row)
+                continue
+            for line in out.stdout.splitlines():
+                if line.startswith('{'): print(line, flush=True); results.append(json.loads(line))
+    if args.out:
+        import pandas
+        meta = {'python': platform.python_version(), 'pandas': pandas.__version__, 'cpus': os.cpu_count(), 'platform': platform.platform(),
+                'files': args.files, 'sheets': args.sheets, 'devices': args.devices}
+        with open(args.out, 'w') as fh: json.dump({'meta': meta, 'results': results}, fh, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Synthetic Shield exports for benchmarks: realistic columns, skewed domains/devices, header aliases.
+
+Usage: python benchmarks/synth.py OUT.xlsx --rows N [--sheets S] [--devices D] [--seed K]
+
+Odd-numbered data sheets use the alternate headers the compiler accepts (`Device`, `Client Country`, padded ` Status `),
+and every workbook starts with a `Summary` sheet that has no Status column and must be skipped.
+"""
+import argparse
+import json
+import os
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+with open(os.path.join(ROOT, 'categories.json'), encoding='utf-8') as fh: RISK_REASONS = list(json.load(fh)) + ['Dynamic DNS']
+
+STATUSES = ['Blocked', 'Allowed', 'Blocked (DNS)']
+STATUS_P = [0.35, 0.6, 0.05]
+COUNTRIES = ['United States', 'Germany', 'China', 'Russia', 'Netherlands', 'Singapore', 'Brazil', 'RFC1918 Private', 'Reserved', 'Local', 'Unknown']
+COUNTRY_P = [0.4, 0.1, 0.08, 0.06, 0.08, 0.05, 0.03, 0.1, 0.03, 0.03, 0.04]
+MAX_SHEET_ROWS = 1_048_575  # Excel's row limit, minus the header
+
+def synth_frame(rows, devices=10, seed=0, alias=False):
+    """One sheet's worth of parsed Shield rows. Domains and devices are Zipf-skewed so some pairs repeat across files."""
+    rng = np.random.default_rng(seed)
+    pool = max(1_000, rows // 20)
+    domain_id = (rng.zipf(1.3, rows) - 1) % pool
+    status = rng.choice(STATUSES, rows, p=STATUS_P)
+    blocked = status != 'Allowed'
+    reason = np.where(blocked, rng.choice(RISK_REASONS, rows), None)
+    octets = np.stack([(domain_id * k + 11) % 223 + 1 for k in (7, 13, 17, 19)], axis=1)
+    df = pd.DataFrame({
+        'Status': status,
+        'Device Name': np.char.add('SHIELD-', np.char.zfill(((rng.zipf(1.6, rows) - 1) % devices + 1).astype(str), 2)),
+        'Domain': np.char.add(np.char.add('host', domain_id.astype(str)), '.example.net'),
+        'Count': rng.geometric(0.15, rows),
+        'Risk Reason': reason,
+        'Server Country': rng.choice(COUNTRIES, rows, p=COUNTRY_P),
+        'DNS Answers': ['.'.join(map(str, o)) for o in octets],
+    })
+    if alias: df = df.rename(columns={'Status': ' Status ', 'Device Name': 'Device', 'Server Country': 'Client Country'})
+    return df
+
+_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG = 'http://schemas.openxmlformats.org/package/2006'
+_CT = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+WRITE_CHUNK = 100_000
+
+def _cells(values, strings):
+    """Per-row <c> XML for one column: text goes through the shared-string table, numbers are written inline."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values): return ('<c><v>' + values.astype(str) + '</v></c>').to_numpy()
+    codes, uniques = pd.factorize(values)
+    xml = np.array([f'<c t="s"><v>{strings.setdefault(u, len(strings))}</v></c>' for u in uniques] + ['<c/>'], dtype=object)
+    return xml[codes]
+
+def _sheet_xml(fh, df, strings):
+    fh.write(f'{_XML}<worksheet xmlns="{_NS}"><sheetData>'.encode())
+    fh.write(('<row>' + ''.join(_cells([c], strings)[0] for c in df.columns) + '</row>').encode())
+    for lo in range(0, len(df), WRITE_CHUNK):
+        part = df.iloc[lo:lo + WRITE_CHUNK]
+        cols = [_cells(part[c].to_numpy(), strings) for c in part.columns]
+        fh.write(''.join('<row>' + ''.join(r) + '</row>' for r in zip(*cols)).encode())
+    fh.write(b'</sheetData></worksheet>')
+
+def write_xlsx(path, rows, sheets=2, devices=10, seed=0):
+    """Write a Summary sheet plus `sheets` data sheets totalling `rows` rows (more sheets if Excel's row limit requires).
+
+    The SpreadsheetML is streamed straight into the zip with a shared-string table, as Excel itself writes exports;
+    openpyxl's write-only mode manages only a few thousand rows per second, which rules out multi-million-row inputs.
+    """
+    sheets = max(sheets, -(-rows // MAX_SHEET_ROWS))
+    parts = [('Summary', lambda: pd.DataFrame({'Shield DNS export': ['rows'], 'synthetic': [rows]}))]
+    for s in range(sheets):
+        n = rows // sheets + (1 if s < rows % sheets else 0)
+        parts.append((f'Sheet{s + 1}', lambda n=n, s=s: synth_frame(n, devices, seed * 1_000 + s, alias=bool(s % 2))))
+    strings = {}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i, (_, make) in enumerate(parts, 1):
+            with zf.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as fh: _sheet_xml(fh, make(), strings)
+        sst = ''.join(f'<si><t xml:space="preserve">{escape(str(v))}</t></si>' for v in strings)
+        zf.writestr('xl/sharedStrings.xml', f'{_XML}<sst xmlns="{_NS}" count="{len(strings)}" uniqueCount="{len(strings)}">{sst}</sst>')
+        zf.writestr('xl/workbook.xml', f'{_XML}<workbook xmlns="{_NS}" xmlns:r="{_REL}"><sheets>'
+                    + ''.join(f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>' for i, (name, _) in enumerate(parts, 1)) + '</sheets></workbook>')
+        zf.writestr('xl/_rels/workbook.xml.rels', f'{_XML}<Relationships xmlns="{_PKG}/relationships">'
+                    + ''.join(f'<Relationship Id="rId{i}" Type="{_REL}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(parts) + 1))
+                    + f'<Relationship Id="rId{len(parts) + 1}" Type="{_REL}/sharedStrings" Target="sharedStrings.xml"/></Relationships>')
+        zf.writestr('_rels/.rels', f'{_XML}<Relationships xmlns="{_PKG}/relationships"><Relationship Id="rId1" Type="{_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        zf.writestr('[Content_Types].xml', f'{_XML}<Types xmlns="{_PKG}/content-types">'
+                    + '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/><Default Extension="xml" ContentType="application/xml"/>'
+                    + f'<Override PartName="/xl/workbook.xml" ContentType="{_CT}.sheet.main+xml"/>'
+                    + ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{_CT}.worksheet+xml"/>' for i in range(1, len(parts) + 1))
+                    + f'<Override PartName="/xl/sharedStrings.xml" ContentType="{_CT}.sharedStrings+xml"/></Types>')
+    return path
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('path')
+    ap.add_argument('--rows', type=int, required=True)
+    ap.add_argument('--sheets', type=int, default=2)
+    ap.add_argument('--devices', type=int, default=10)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+    write_xlsx(args.path, args.rows, args.sheets, args.devices, args.seed)
+    print(args.path, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Headless compile-and-report job: python cli.py EXPORT_DIR --out OUT_DIR
+
+Compiles every dated XLSX export in EXPORT_DIR with the same rules as the app's START COMPILATION,
+then writes one PDF executive report per device and a rankings table of top blocked rows per device.
+Streamlit, Plotly and the UI theme are never imported; pandas and the engine load only after arguments parse.
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+from datetime import date
+
+def _parse_args(argv):
+    ap = argparse.ArgumentParser(prog='cli.py', description=__doc__.splitlines()[0])
+    ap.add_argument('export_dir', help="directory of .xlsx exports; audit dates are read from the filenames")
+    ap.add_argument('--out', required=True, help="output directory for PDFs and rankings")
+    ap.add_argument('--default-date', type=date.fromisoformat, help="audit date for files without a date in their name (YYYY-MM-DD)")
+    ap.add_argument('--start', type=date.fromisoformat, help="report window start (default: first audit date)")
+    ap.add_argument('--end', type=date.fromisoformat, help="report window end (default: last audit date)")
+    ap.add_argument('--device', action='append', dest='devices', help="only report this device (repeatable)")
+    ap.add_argument('--depth', type=int, default=200, help="top blocked rows per device in the rankings (default: 200)")
+    ap.add_argument('--rankings-format', choices=['csv', 'parquet'], default='csv', help="parquet needs pyarrow (default: csv)")
+    ap.add_argument('--include-rfc', action='store_true', help="keep RFC/private ranges in the country charts")
+    ap.add_argument('--no-pdf', action='store_true', help="skip PDF rendering")
+    ap.add_argument('--workers', type=int, help="worker processes (default: SHIELD_WORKERS or CPU count)")
+    ap.add_argument('--spans', help="write this run's timing spans to this JSON-lines file")
+    args = ap.parse_args(argv)
+    if args.rankings_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        ap.error("--rankings-format parquet needs pyarrow (pip install pyarrow)")
+    return args
+
+def _log(msg):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", file=sys.stderr, flush=True)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.workers: os.environ['SHIELD_WORKERS'] = str(args.workers)
+
+    # Heavy imports start here, after argument handling.
+    import pandas as pd
+    from analytics import CubeSet, category_column, country_column, device_reports, rank_rows
+    from diagnostics import SPANS
+    from engine import compile_batch, merge_compiled
+    from ingest import content_hash, date_from_filename, open_parse_cache
+    from store import PartitionedDB, RepeatIndex
+
+    batch = []
+    for name in sorted(os.listdir(args.export_dir)):
+        if not name.lower().endswith('.xlsx') or name.startswith('~$'): continue
+        audit_date = date_from_filename(name) or args.default_date
+        if audit_date is None: sys.exit(f"error: no audit date in {name!r}; rename it or pass --default-date")
+        batch.append((name, audit_date))
+    if not batch: sys.exit(f"error: no .xlsx exports in {args.export_dir}")
+    batch.sort(key=lambda b: b[1])  # registry order follows audit date, as in the app
+
+    files, keys, seen = [], [], {}
+    for name, audit_date in batch:
+        with open(os.path.join(args.export_dir, name), 'rb') as fh: data = fh.read()
+        sha = content_hash(data)
+        if sha in seen: _log(f"  {name}: same content as {seen[sha]}, skipped"); continue
+        seen[sha] = name
+        files.append((name, data, audit_date)); keys.append(sha)
+    _log(f"compiling {len(files)} file(s)")
+    compiled = compile_batch(files, RepeatIndex(), on_progress=lambda done, total, sheet: _log(f"  sheet {done}/{total}: {sheet}"), keys=keys, cache=open_parse_cache())
+    master, cubes = merge_compiled(PartitionedDB(), CubeSet(), compiled)
+    db = master.frame()
+    if db.empty: sys.exit("error: no sheet with a Status column was found")
+    _log(f"compiled {len(db):,} rows")
+
+    start = args.start or db['Processed_Date'].min().date()
+    end = args.end or db['Processed_Date'].max().date()
+    devices = args.devices or sorted(db['Device Name'].dropna().unique().tolist())
+    os.makedirs(args.out, exist_ok=True)
+
+    ranks = []
+    for dev in devices:
+        res = rank_rows.uncached(db, start, end, dev, None, args.depth)
+        ranks.append(res.rename_axis('Rank').reset_index())
+    rankings = pd.concat(ranks, ignore_index=True) if ranks else pd.DataFrame()
+    rank_path = os.path.join(args.out, f"rankings.{args.rankings_format}")
+    if args.rankings_format == 'csv': rankings.to_csv(rank_path, index=False)
+    else:
+        # Categories and passthrough export columns can mix value types (53 and '-'); Parquet gets them as strings.
+        text = [c for c in rankings.columns if rankings[c].dtype == object or isinstance(rankings[c].dtype, pd.CategoricalDtype)]
+        rankings.astype({c: object for c in text}).astype({c: 'str' for c in text}).to_parquet(rank_path, index=False)
+    _log(f"wrote {rank_path} ({len(rankings):,} rows)")
+
+    if not args.no_pdf:
+        from report import render_reports, report_filename  # matplotlib + fpdf, only when PDFs are wanted
+        cat_col, c_col = category_column(db), country_column(db)
+        reports, jobs = device_reports.uncached(cubes, start, end, not args.include_rfc, cat_col=cat_col), []
+        for dev in devices:
+            if dev not in reports: _log(f"  {dev}: no rows in window, skipped"); continue
+            jobs.append((reports[dev], start, end, dev, c_col))
+        for (_, _, _, dev, _), pdf in zip(jobs, render_reports(jobs, on_progress=lambda done, total, dev: _log(f"  rendered {done}/{total}: {dev}"))):
+            with open(os.path.join(args.out, report_filename(dev)), 'wb') as fh: fh.write(pdf)
+        _log(f"wrote {len(jobs)} PDF report(s) to {args.out}")
+    if args.spans:
+        with open(args.spans, 'w', encoding='utf-8') as fh: fh.write(SPANS.to_jsonl())
+        _log(f"wrote {len(SPANS.records)} span(s) to {args.spans}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Timing spans for the compile, tab and report hot paths (wall time, rows, RSS delta), kept in memory and exportable as JSON lines."""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SPANS_LOG_PATH = os.environ.get('SHIELD_SPANS_LOG')
+SPAN_HISTORY = int(os.environ.get('SHIELD_SPAN_HISTORY', 1000))
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_parent = contextvars.ContextVar('span_parent', default=None)
+_session = contextvars.ContextVar('span_session', default=None)
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as fh: return int(fh.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError): return None
+
+def bind_session(session_id):
+    """Tag spans opened from now on in this context (a Streamlit script run) with `session_id`."""
+    _session.set(session_id)
+
+class SpanLog:
+    """Bounded, thread-safe record of finished spans, optionally mirrored line by line to a JSON-lines file.
+
+    One log serves the whole process; records carry the `session` bound when they were opened, and the read/clear
+    methods take a session to see only that user's spans. Spans opened in pool workers land in that worker's log;
+    with a file configured every process appends to it.
+    """
+    def __init__(self, maxlen=SPAN_HISTORY, path=SPANS_LOG_PATH):
+        self.records = deque(maxlen=maxlen)
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Time a block; the yielded dict takes extra fields (e.g. `rows`) and is recorded when the block exits."""
+        rec = {'ts': round(time.time(), 3), 'name': name, 'parent': _parent.get(), 'session': _session.get(), 'pid': os.getpid(), 'rows': None, **fields}
+        token = _parent.set(name)
+        rss0, t0 = rss_bytes(), time.perf_counter()
+        try: yield rec
+        except BaseException as exc:
+            rec['error'] = type(exc).__name__
+            raise
+        finally:
+            rec['wall_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+            rss1 = rss_bytes()
+            rec['mem_delta_mb'] = round((rss1 - rss0) / 2**20, 2) if rss0 is not None and rss1 is not None else None
+            _parent.reset(token)
+            self._record(rec)
+
+    def _record(self, rec):
+        line = json.dumps(rec, default=str)
+        with self._lock:
+            self.records.append(rec)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as fh: fh.write(line + '\n')
+
+    def snapshot(self, session=None):
+        """Recorded spans, oldest first; only `session`'s when given."""
+        with self._lock: return [rec for rec in self.records if session is None or rec['session'] == session]
+
+    def to_jsonl(self, session=None):
+        return ''.join(json.dumps(rec, default=str) + '\n' for rec in self.snapshot(session))
+
+    def clear(self, session=None):
+        with self._lock:
+            keep = [] if session is None else [rec for rec in self.records if rec['session'] != session]
+            self.records.clear()
+            self.records.extend(keep)
+
+SPANS = SpanLog()
+span = SPANS.span
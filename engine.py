@@ -0,0 +1,52 @@
+"""Headless compile pipeline shared by the Streamlit app and the batch CLI (no UI imports)."""
+import numpy as np
+import pandas as pd
+
+from analytics import build_cubes, classify
+from diagnostics import span
+from ingest import normalize_sheet, parse_files
+from store import pair_hashes
+
+def file_id_for(filename, audit_date):
+    return f"{filename}_{audit_date}"
+
+def compile_sheets(sheets, file_id, audit_date, index):
+    """Normalize, classify and repeat-tag one file's parsed sheets, then record its pairs in `index`."""
+    all_sheets_data, file_hashes = [], []
+    for sheet_name, df in sheets:
+        df = classify(normalize_sheet(df))  # is_blocked / category / country_class, derived once per row
+        df['_file_id'] = file_id
+
+        # Sheets are tagged against earlier files only; this file's pairs join the index once it is done.
+        hashes = pair_hashes(df)
+        df['Is_Repeat'] = index.contains(hashes)
+        file_hashes.append(hashes)
+        df['Processed_Date'] = pd.Timestamp(audit_date)
+        all_sheets_data.append(df)
+    index.add(file_id, np.concatenate(file_hashes) if file_hashes else np.empty(0, dtype=np.uint64))
+    return pd.concat(all_sheets_data, ignore_index=True) if all_sheets_data else pd.DataFrame()
+
+def compile_batch(batch, index, on_progress=None, keys=None, cache=None):
+    """Compile [(filename, xlsx_bytes, audit_date)] in registry order; returns [(file_id, frame)].
+
+    Sheets of every file are parsed across the worker pool (or read from `cache` by content hash `keys`);
+    tagging then runs file by file in batch order.
+    """
+    with span('ingest.parse', files=len(batch)) as s:
+        parsed = parse_files([data for _, data, _ in batch], on_progress=on_progress, keys=keys, cache=cache)
+        s['rows'] = sum(len(df) for sheets in parsed for _, df in sheets)
+    out = []
+    for (filename, _, audit_date), sheets in zip(batch, parsed):
+        file_id = file_id_for(filename, audit_date)
+        with span('ingest.classify_tag', file=file_id) as s:
+            out.append((file_id, compile_sheets(sheets, file_id, audit_date, index)))
+            s['rows'] = len(out[-1][1])
+    return out
+
+def merge_compiled(db, cubes, compiled):
+    """Append compiled files to the master DB (a PartitionedDB) and its CubeSet, both updated in place."""
+    for file_id, new_df in compiled:
+        if new_df.empty: continue
+        db.add(file_id, new_df)
+        cubes.add(file_id, build_cubes(new_df))
+    return db, cubes
@@ -0,0 +1,346 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import posixpath
+import re
+import zipfile
+from datetime import date, datetime, time, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+# --- 1. SCHEMA ---
+# The compiler reads USED_COLUMNS; other named export columns pass through as text so Threat Rankings shows whole rows.
+# Readers take `columns=USED_COLUMNS` to materialize only the compiler's columns (blank-header columns are always skipped).
+ANSWER_COLUMNS = ['DNS Answers', 'DNS Answer', 'Answer', 'Response', 'Server IP']
+USED_COLUMNS = ['Status', 'Device Name', 'Device', 'Domain', 'Count', 'Risk Reason', 'Server Country', 'Client Country', 'Location'] + ANSWER_COLUMNS
+NUMERIC_COLUMNS = {'Count'}
+CHUNK_ROWS = 50_000
+MAX_WORKERS = int(os.environ.get('SHIELD_WORKERS', 0)) or os.cpu_count() or 1
+
+def _typed_chunk(name, values):
+    if name in NUMERIC_COLUMNS:
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype='float64')
+    return np.array(values, dtype=object)
+
+def _read_body(rows, keep, chunk_rows):
+    """Stream the remaining rows of a sheet into typed per-column chunks."""
+    chunks = {name: [] for _, name in keep}
+    buf = {name: [] for _, name in keep}
+    filled = 0
+    for row in rows:
+        vals = [row[i] if i < len(row) else None for i, _ in keep]
+        if all(v is None for v in vals): continue
+        for (_, name), v in zip(keep, vals): buf[name].append(v)
+        filled += 1
+        if filled == chunk_rows:
+            for name in buf: chunks[name].append(_typed_chunk(name, buf[name])); buf[name] = []
+            filled = 0
+    if filled:
+        for name in buf: chunks[name].append(_typed_chunk(name, buf[name]))
+    return {name: (np.concatenate(parts) if parts else _typed_chunk(name, [])) for name, parts in chunks.items()}
+
+def _read_sheet(ws, wanted, chunk_rows):
+    """Return a sheet's named columns (only those in `wanted`, if given), or None when its header row has no `Status` column."""
+    header = next(ws.iter_rows(max_row=1, values_only=True), None) or ()
+    names = [str(h).strip() if h is not None else '' for h in header]
+    if 'Status' not in names: return None
+    keep, seen = [], set()
+    for idx, name in enumerate(names):
+        if name and (wanted is None or name in wanted) and name not in seen: keep.append((idx, name)); seen.add(name)
+    rows = ws.iter_rows(min_row=2, max_col=max(idx for idx, _ in keep) + 1, values_only=True)
+    return _read_body(rows, keep, chunk_rows)
+
+def _iter_columns(file, columns=None, chunk_rows=CHUNK_ROWS, sheets=None):
+    """Yield (index, total, sheet_name, columns dict or None) per sheet (only those named in `sheets`, if given) from one workbook load."""
+    from openpyxl import load_workbook  # deferred: only needed once a workbook is actually parsed
+    wanted = None if columns is None else set(columns)
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        total = len(wb.sheetnames)
+        for i, ws in enumerate(wb.worksheets):
+            if sheets is None or ws.title in sheets: yield i, total, ws.title, _read_sheet(ws, wanted, chunk_rows)
+    finally:
+        wb.close()
+
+def iter_sheets(file, columns=None, chunk_rows=CHUNK_ROWS):
+    """Yield (index, total, sheet_name, frame) for every sheet in a workbook.
+
+    The workbook is opened in openpyxl read-only mode so rows are streamed rather than loaded as a DOM.
+    Each sheet's header row is checked first; sheets without a `Status` column yield `None` without their body being read.
+    """
+    for i, total, name, cols in _iter_columns(file, columns, chunk_rows):
+        yield i, total, name, None if cols is None else pd.DataFrame(cols)
+
+# --- 2. PARALLEL BATCH PARSING ---
+# Sheets are probed in the parent straight from the zip, so skipped sheets never cost a worker a workbook load;
+# each job then opens its workbook once for a group of sheets.
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _manifest(zf):
+    """([(sheet_name, part path)] in workbook order, shared-strings part or None), resolved through the workbook rels."""
+    rels = ElementTree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    targets, sst = {}, None
+    for el in rels.iter():
+        if _local(el.tag) != 'Relationship': continue
+        target = el.get('Target', '')
+        target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        targets[el.get('Id')] = target
+        if el.get('Type', '').endswith('/sharedStrings'): sst = target
+    sheets = []
+    for el in ElementTree.fromstring(zf.read('xl/workbook.xml')).iter():
+        if _local(el.tag) == 'sheet':
+            rid = next((v for k, v in el.attrib.items() if _local(k) == 'id'), None)
+            sheets.append((el.get('name'), targets.get(rid)))
+    return sheets, sst
+
+def _header_cells(zf, part):
+    """Row 1 of a sheet part as [(cell type, raw text)], streamed so the body is never read."""
+    cells = []
+    with zf.open(part) as fh:
+        for _, el in ElementTree.iterparse(fh):
+            tag = _local(el.tag)
+            if tag == 'c': cells.append((el.get('t'), ''.join(t.text or '' for t in el.iter() if _local(t.tag) in ('v', 't'))))
+            elif tag == 'row': return cells if el.get('r') in (None, '1') else []
+    return cells
+
+def _shared_strings(zf, part, needed):
+    """{index: text} for the `needed` shared strings, streaming the table only as far as the largest index."""
+    found, last = {}, max(needed, default=-1)
+    if part is None or last < 0: return found
+    with zf.open(part) as fh:
+        for i, (_, el) in enumerate(e for e in ElementTree.iterparse(fh) if _local(e[1].tag) == 'si'):
+            if i in needed:
+                found[i] = ''.join(t.text or '' for node in el if _local(node.tag) in ('t', 'r')
+                                   for t in ([node] if _local(node.tag) == 't' else node) if _local(t.tag) == 't')
+            el.clear()
+            if i >= last: break
+    return found
+
+def sheet_names(data):
+    """List a workbook's sheets from its zip manifest without loading shared strings or styles."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf: return [name for name, _ in _manifest(zf)[0]]
+
+def probe_sheets(data):
+    """[(sheet_name, has_status)] for an in-memory workbook; a sheet whose header cannot be probed counts as conforming."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        sheets, sst = _manifest(zf)
+        headers = {}
+        for name, part in sheets:
+            try: headers[name] = _header_cells(zf, part)
+            except (KeyError, TypeError, ElementTree.ParseError): headers[name] = None
+        needed = {int(v) for cells in headers.values() if cells for t, v in cells if t == 's' and v.isdigit()}
+        try: strings = _shared_strings(zf, sst, needed)
+        except (KeyError, ElementTree.ParseError): return [(name, True) for name, _ in sheets]
+    def text(t, v): return strings.get(int(v), '') if t == 's' and v.isdigit() else v
+    return [(name, True if headers[name] is None else any(text(t, v).strip() == 'Status' for t, v in headers[name])) for name, _ in sheets]
+
+def _pack(cols):
+    """Factorize text columns into int32 codes + uniques so worker results pickle compactly."""
+    packed = {}
+    for name, values in cols.items():
+        if values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            packed[name] = (codes.astype(np.int32), np.asarray(uniques, dtype=object))
+        else: packed[name] = values
+    return packed
+
+def _unpack(packed):
+    cols = {}
+    for name, values in packed.items():
+        if isinstance(values, tuple):
+            codes, uniques = values
+            out = uniques.take(codes) if len(uniques) else np.full(len(codes), None, dtype=object)
+            out[codes < 0] = None
+            cols[name] = out
+        else: cols[name] = values
+    return pd.DataFrame(cols)
+
+def parse_workbook(data, sheets=None, columns=None, chunk_rows=CHUNK_ROWS):
+    """Pool worker: parse the named sheets (default: all) of an in-memory workbook in one load; [(sheet_name, packed columns or None)]."""
+    return [(name, None if cols is None else _pack(cols)) for _, _, name, cols in _iter_columns(io.BytesIO(data), columns, chunk_rows, sheets)]
+
+def _groups(names, parts):
+    """Split a workbook's sheet names into `parts` contiguous groups."""
+    size = -(-len(names) // max(1, min(parts, len(names))))
+    return [names[i:i + size] for i in range(0, len(names), size)]
+
+def parse_files(files, on_progress=None, max_workers=MAX_WORKERS, keys=None, cache=None):
+    """Parse every sheet of every workbook (raw bytes), across a process pool when that pays off.
+
+    Returns one list of (sheet_name, frame) per file, in input and sheet order, with non-conforming sheets dropped.
+    `on_progress(done, total, label)` is called from the calling thread as sheets complete.
+    With a `ParseCache`, files whose content hash (`keys`, computed if omitted) is cached skip the Excel parse entirely.
+
+    Serially, each workbook is streamed once. With a pool, sheet headers are probed in the parent first and only
+    conforming sheets are dispatched, one job per workbook, or a few per workbook when there are fewer files than workers.
+    """
+    if cache is not None and keys is None: keys = [content_hash(data) for data in files]
+    packed = {f_idx: cache.get(keys[f_idx]) for f_idx in range(len(files))} if cache is not None else {}
+    packed = {f_idx: sheets for f_idx, sheets in packed.items() if sheets is not None}
+    todo = [f_idx for f_idx in range(len(files)) if f_idx not in packed]
+    jobs = []
+    if max_workers > 1 and todo:
+        wanted = {f_idx: [name for name, ok in probe_sheets(files[f_idx]) if ok] for f_idx in todo}
+        jobs = [(f_idx, group) for f_idx in todo if wanted[f_idx] for group in _groups(wanted[f_idx], -(-max_workers // len(todo)))]
+    results = {}
+    if len(jobs) <= 1:
+        total, done = sum(len(sheet_names(files[f_idx])) for f_idx in todo), 0
+        for f_idx in todo:
+            results[f_idx] = []
+            for _, _, name, cols in _iter_columns(io.BytesIO(files[f_idx])):
+                results[f_idx].append((name, None if cols is None else _pack(cols)))
+                done += 1
+                if on_progress: on_progress(done, total, name)
+    else:
+        total, done, by_job = sum(len(group) for _, group in jobs), 0, {}
+        ctx = multiprocessing.get_context('spawn')  # fork is unsafe under Streamlit's server threads
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs)), mp_context=ctx) as pool:
+            futures = {pool.submit(parse_workbook, files[f_idx], group): j for j, (f_idx, group) in enumerate(jobs)}
+            for fut in as_completed(futures):
+                by_job[futures[fut]] = sheets = fut.result()
+                done += len(sheets)
+                if on_progress: on_progress(done, total, sheets[-1][0])
+        for j, (f_idx, _) in enumerate(jobs): results.setdefault(f_idx, []).extend(by_job[j])
+    parsed = {f_idx: [(name, cols) for name, cols in results.get(f_idx, []) if cols is not None] for f_idx in todo}
+    if cache is not None:
+        for f_idx, sheets in parsed.items(): cache.put(keys[f_idx], sheets)
+    packed.update(parsed)
+    return [[(name, _unpack(cols)) for name, cols in packed.get(f_idx, [])] for f_idx in range(len(files))]
+
+def date_from_filename(name):
+    """Best-effort audit date from an export filename (YYYY-MM-DD, YYYY_MM_DD or YYYYMMDD), else None."""
+    for m in re.finditer(r'(20\d{2})[-_.]?(\d{2})[-_.]?(\d{2})', name):
+        try: return date(*map(int, m.groups()))
+        except ValueError: continue
+    return None
+
+def normalize_sheet(df):
+    """Apply the compiler's column rules to a parsed sheet (device/country aliases, numeric Count)."""
+    if 'Device Name' not in df.columns and 'Device' in df.columns: df = df.rename(columns={'Device': 'Device Name'})
+    if 'Server Country' not in df.columns and 'Client Country' in df.columns:
+        df = df.rename(columns={'Client Country': 'Server Country'})
+    df['Count'] = pd.to_numeric(df['Count'], errors='coerce').fillna(0) if 'Count' in df.columns else 0.0
+    return df
+
+# --- 3. CONTENT-ADDRESSED PARSE CACHE ---
+# Parsed sheets are cached by a hash of the workbook bytes, so a re-ingest of the same export (renamed or re-dated) skips openpyxl.
+HASH_CHUNK = 1 << 20
+PARSE_CACHE_DIR = os.environ.get('SHIELD_PARSE_CACHE_DIR')  # opt-in, like SHIELD_STORE_DIR: cached sheets are raw security logs
+PARSE_CACHE_BYTES = int(float(os.environ.get('SHIELD_PARSE_CACHE_MB', 1024)) * 1024 * 1024)
+CACHE_VERSION = 2  # bump whenever the reader's output changes (columns kept, typing, skipping rules)
+PARSE_FORMAT = hashlib.sha1(f"{CACHE_VERSION}:{USED_COLUMNS}:{sorted(NUMERIC_COLUMNS)}".encode()).hexdigest()[:12]
+
+def content_hash(src, chunk_size=HASH_CHUNK):
+    """SHA-256 of a workbook, fed in fixed-size chunks from bytes or a binary file object (its position is restored)."""
+    h = hashlib.sha256()
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        view = memoryview(src)
+        for i in range(0, len(view), chunk_size): h.update(view[i:i + chunk_size])
+    else:
+        pos = src.tell()
+        src.seek(0)
+        for chunk in iter(lambda: src.read(chunk_size), b''): h.update(chunk)
+        src.seek(pos)
+    return h.hexdigest()
+
+# Cached text uniques are Python scalars of mixed types; each is stored as UTF-8 text plus a type tag, so entries are
+# plain arrays loaded with allow_pickle=False and round-trip exactly.
+_VALUE_TYPES = [str, int, float, bool, datetime, date, time, timedelta]
+_TO_TEXT = {int: repr, float: repr, bool: repr, datetime: datetime.isoformat, date: date.isoformat, time: time.isoformat,
+            timedelta: lambda v: f"{v.days},{v.seconds},{v.microseconds}"}
+_FROM_TEXT = [str, int, float, lambda t: t == 'True', datetime.fromisoformat, date.fromisoformat, time.fromisoformat,
+              lambda t: timedelta(*map(int, t.split(',')))]
+
+def _values_to_arrays(values):
+    """(type tags, UTF-8 bytes, end offsets) for a list of scalars, or None if one has a type the cache cannot store."""
+    tags, chunks = np.empty(len(values), dtype=np.int8), []
+    for i, v in enumerate(values):
+        if type(v) not in _VALUE_TYPES: return None
+        tags[i] = _VALUE_TYPES.index(type(v))
+        chunks.append(_TO_TEXT.get(type(v), str)(v).encode('utf-8'))
+    return tags, np.frombuffer(b''.join(chunks), dtype=np.uint8), np.cumsum([len(c) for c in chunks], dtype=np.int64)
+
+def _arrays_to_values(tags, data, ends):
+    raw, out, start = data.tobytes(), np.empty(len(tags), dtype=object), 0
+    for i, (tag, end) in enumerate(zip(tags, ends)):
+        out[i] = _FROM_TEXT[tag](raw[start:end].decode('utf-8'))
+        start = end
+    return out
+
+class ParseCache:
+    """Bounded on-disk map: content hash -> that workbook's parsed sheets as packed columns.
+
+    Entries are `.npz` files of plain arrays (never pickles) whose name carries `PARSE_FORMAT`, so a reader change
+    misses instead of serving the old column set. Reads refresh an entry's mtime and writes evict the least recently
+    used entries once the directory exceeds `max_bytes`.
+    """
+    def __init__(self, root=PARSE_CACHE_DIR, max_bytes=PARSE_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, mode=0o700, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.{PARSE_FORMAT}.npz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                meta, sheets = json.loads(str(npz['meta'])), []
+                for s_idx, (name, columns) in enumerate(meta):
+                    cols = {}
+                    for c_idx, (col, packed) in enumerate(columns):
+                        k = f"s{s_idx}c{c_idx}"
+                        cols[col] = (npz[f"{k}codes"], _arrays_to_values(npz[f"{k}tags"], npz[f"{k}text"], npz[f"{k}ends"])) if packed else npz[k]
+                    sheets.append((name, cols))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile): return None
+        try: os.utime(path)
+        except FileNotFoundError: pass  # evicted by another session after the read; the data is already loaded
+        return sheets
+
+    def put(self, key, sheets):
+        """Store one workbook's sheets; skipped (nothing written) if a cell value has a type the format cannot hold."""
+        arrays, meta = {}, []
+        for s_idx, (name, cols) in enumerate(sheets):
+            columns = []
+            for c_idx, (col, values) in enumerate(cols.items()):
+                k = f"s{s_idx}c{c_idx}"
+                if isinstance(values, tuple):
+                    encoded = _values_to_arrays(values[1])
+                    if encoded is None: return
+                    arrays[f"{k}codes"] = values[0]
+                    arrays[f"{k}tags"], arrays[f"{k}text"], arrays[f"{k}ends"] = encoded
+                else: arrays[k] = values
+                columns.append((col, isinstance(values, tuple)))
+            meta.append((name, columns))
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as fh: np.savez(fh, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for e in os.scandir(self.root):
+            if e.name.endswith('.tmp'): continue
+            try:
+                if e.is_file(): info = e.stat(); entries.append((info.st_mtime, info.st_size, e.path))
+            except FileNotFoundError: continue  # removed by a concurrent eviction
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            total -= size
+
+def open_parse_cache():
+    """The parse cache configured by SHIELD_PARSE_CACHE_DIR/_MB, or None when unset, disabled (size 0) or not creatable."""
+    if not PARSE_CACHE_DIR or PARSE_CACHE_BYTES <= 0: return None
+    try: return ParseCache()
+    except OSError: return None
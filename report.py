@@ -0,0 +1,128 @@
+import io
+import multiprocessing
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fpdf import FPDF
+from matplotlib.figure import Figure
+
+from analytics import kill_split
+from diagnostics import span
+from ingest import MAX_WORKERS
+
+# --- 1. PROFESSIONAL PDF ENGINE (OG 3-PAGE DESIGN) ---
+# Needs fpdf2, whose image() accepts file-like objects.
+REPORT_TEXTS = {'cat_txt': 'Threat Summary Analysis...', 'country_txt': 'Query Origin Analysis...'}
+
+def _png(fig):
+    buf = io.BytesIO()
+    with span('pdf.savefig'): fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+    buf.seek(0)
+    return buf
+
+class PDFReport(FPDF):
+    def add_secret_stamps(self, p_num):
+        self.set_font("Helvetica", 'B', 8)
+        self.set_text_color(170, 170, 170)
+        self.text(95, 10, "PSOPC")
+        self.text(95, 287, "PSOPC")
+        self.set_font("Helvetica", '', 8)
+        self.text(180, 287, f"Page {p_num} of 3")
+
+def generate_pdf_report(start_date, end_date, sensor_id, dk, tk, uk, figs, dynamic_texts):
+    """Lay out the 3-page report; `figs` are matplotlib figures, rasterized straight into the PDF."""
+    pdf = PDFReport()
+    # PAGE 1
+    pdf.add_page(); pdf.add_secret_stamps(1)
+    pdf.set_font("Helvetica", 'B', 18); pdf.set_text_color(29, 78, 216)
+    pdf.cell(0, 15, "APPLIED THREAT INTELLIGENCE MONTHLY REPORT", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", '', 11); pdf.set_text_color(100, 116, 139)
+    date_str = f"Reporting Period: {start_date.strftime('%B %d')} - {end_date.strftime('%B %d, %Y')}"
+    pdf.cell(0, 5, date_str, new_x="LMARGIN", new_y="NEXT"); pdf.ln(10)
+    pdf.set_text_color(0, 0, 0)
+    for label, val in [("OFFICE/LOCATION:", "Head Office"), ("SENSOR ID:", sensor_id), ("OPERATIONAL MODE:", "Protect Mode")]:
+        pdf.set_font("Helvetica", 'B', 10); pdf.cell(45, 7, label, 0)
+        pdf.set_font("Helvetica", '', 10); pdf.cell(0, 7, val, new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(10); pdf.set_font("Helvetica", 'I', 9); pdf.set_text_color(71, 85, 105)
+    pdf.multi_cell(0, 5, "A Shield in Protect mode will analyze and report on all traffic and kill anything unsafe. Observe mode will analyze and report on all traffic. Off Mode will not analyze nor report on any traffic, but will simply forward traffic.")
+    pdf.ln(10); pdf.set_font("Helvetica", 'B', 12); pdf.set_text_color(0, 0, 0)
+    pdf.cell(60, 10, "DNS Responses", 0); pdf.cell(60, 10, "TCP Sessions", 0); pdf.cell(60, 10, "UDP Sessions", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", 'B', 16); pdf.set_text_color(220, 38, 38)
+    pdf.cell(60, 10, f"{dk:,} Kills", 0); pdf.cell(60, 10, f"{tk:,} Kills", 0); pdf.cell(60, 10, f"{uk:,} Kills", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(15); pdf.set_font("Helvetica", '', 8); pdf.set_text_color(71, 85, 105)
+    pdf.multi_cell(0, 4, "DNS Responses Killed - Number of Responses for High-Risk Host names and domain names killed.\nTCP Session Killed - Killed TCP requests to High-Risk endpoints.\nUDP Session Killed - Killed UDP Session Requests to High-Risk endpoints.")
+    
+    # PAGE 2 & 3: charts go through in-memory PNG buffers, never the filesystem
+
+    pdf.add_page(); pdf.add_secret_stamps(2)
+    pdf.set_font("Helvetica", 'B', 14); pdf.set_text_color(29, 78, 216); pdf.cell(0, 10, "Top Requested domain", new_x="LMARGIN", new_y="NEXT")
+    pdf.image(_png(figs[0]), x=10, y=25, w=185)
+    pdf.set_y(150); pdf.cell(0, 10, "Top Killed Domain", new_x="LMARGIN", new_y="NEXT")
+    pdf.image(_png(figs[1]), x=10, y=165, w=185)
+    
+    pdf.add_page(); pdf.add_secret_stamps(3)
+    pdf.set_font("Helvetica", 'B', 14); pdf.set_text_color(29, 78, 216); pdf.cell(0, 10, "TOP CATEGORIES", new_x="LMARGIN", new_y="NEXT")
+    pdf.image(_png(figs[2]), x=10, y=25, w=90)
+    pdf.set_xy(105, 30); pdf.set_font("Helvetica", '', 8); pdf.set_text_color(50, 50, 50); pdf.multi_cell(90, 4, dynamic_texts['cat_txt'])
+    pdf.set_y(125); pdf.set_font("Helvetica", 'B', 14); pdf.set_text_color(29, 78, 216); pdf.cell(0, 10, "COUNTRIES VISITED", new_x="LMARGIN", new_y="NEXT")
+    pdf.image(_png(figs[3]), x=10, y=140, w=185)
+    pdf.set_y(235); pdf.set_font("Helvetica", '', 8); pdf.multi_cell(0, 4, dynamic_texts['country_txt'])
+    
+    with span('pdf.output'): return bytes(pdf.output())
+
+# --- 2. CHART RENDERING ---
+# Figures are built on standalone Figure objects (no pyplot registry), only when a PDF is actually requested.
+def _bar(ax, df, index, **kwargs):
+    if df.empty: return
+    df.set_index(index).plot(kind='bar', ax=ax, **kwargs)
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels(): label.set_horizontalalignment('right')
+
+def build_figures(rep, c_col):
+    """The four report charts for one `analytics.report_aggregates` result."""
+    f1 = Figure(figsize=(10,5)); _bar(f1.subplots(), rep['tr_data'], 'Domain', color='#2563eb'); f1.tight_layout()
+    f2 = Figure(figsize=(10,5)); _bar(f2.subplots(), rep['tkill_data'], 'Domain', color='#dc2626'); f2.tight_layout()
+    f3 = Figure(figsize=(8,6)); a3 = f3.subplots()
+    if len(rep['cat_sum']): a3.pie(rep['cat_sum']['Count'], autopct='%1.1f%%', colors=['#3b82f6','#ef4444','#10b981','#f59e0b'])
+    f3.tight_layout()
+    f4 = Figure(figsize=(12,6)); _bar(f4.subplots(), rep['c_df'].rename(columns={'Country': c_col}), c_col, color=['#2563eb','#dc2626']); f4.tight_layout()
+    return [f1, f2, f3, f4]
+
+def render_report(rep, start_date, end_date, sensor_id, c_col='Server Country'):
+    """PDF bytes for one device's report aggregates."""
+    dk, tk, uk = kill_split(rep['total'])
+    with span('pdf.render', device=str(sensor_id)):
+        with span('pdf.figures'): figs = build_figures(rep, c_col)
+        return generate_pdf_report(start_date, end_date, sensor_id, dk, tk, uk, figs, REPORT_TEXTS)
+
+def render_reports(jobs, on_progress=None, max_workers=MAX_WORKERS):
+    """Render many reports across worker processes; `jobs` are `render_report` argument tuples, results keep their order."""
+    if max_workers <= 1 or len(jobs) <= 1:
+        out = []
+        for done, job in enumerate(jobs, 1):
+            out.append(render_report(*job))
+            if on_progress: on_progress(done, len(jobs), job[3])
+        return out
+    out = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs)), mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(render_report, *job): i for i, job in enumerate(jobs)}
+        for done, fut in enumerate(as_completed(futures), 1):
+            out[futures[fut]] = fut.result()
+            if on_progress: on_progress(done, len(jobs), jobs[futures[fut]][3])
+    return out
+
+def report_filename(device):
+    return f"ThreatReport_{re.sub(r'[^A-Za-z0-9._-]+', '_', str(device)).strip('_') or 'device'}.pdf"
+
+def render_zip(reports, start_date, end_date, c_col='Server Country', on_progress=None, max_workers=MAX_WORKERS):
+    """Render {device: aggregates} in the worker pool and return one ZIP of `report_filename(device)` PDFs."""
+    jobs = [(rep, start_date, end_date, dev, c_col) for dev, rep in reports.items()]
+    buf, names = io.BytesIO(), set()
+    with span('pdf.zip', devices=len(jobs)), zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for job, pdf in zip(jobs, render_reports(jobs, on_progress, max_workers)):
+            name, k = report_filename(job[3]), 1
+            while name in names: k += 1; name = report_filename(f"{job[3]}_{k}")
+            names.add(name)
+            zf.writestr(name, pdf)
+    return buf.getvalue()
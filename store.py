@@ -0,0 +1,358 @@
+import copy
+import hashlib
+import json
+import os
+from datetime import date
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from diagnostics import span
+
+# --- 1. REPEAT INDEX ---
+REPEAT_KEYS = ['Device Name', 'Domain']
+_EMPTY = np.empty(0, dtype=np.uint64)
+
+def pair_hashes(df):
+    """uint64 hash of each row's (Device Name, Domain) pair."""
+    return pd.util.hash_pandas_object(df.reindex(columns=REPEAT_KEYS), index=False).to_numpy()
+
+def _member(seen, hashes):
+    if not len(seen): return np.zeros(len(hashes), dtype=bool)
+    pos = np.minimum(np.searchsorted(seen, hashes), len(seen) - 1)
+    return seen[pos] == hashes
+
+def _merge(seen, uniq):
+    """Merge sorted unique `uniq` into sorted unique `seen`: only the new hashes are located and inserted, nothing is re-sorted."""
+    new = uniq[~_member(seen, uniq)]
+    return np.insert(seen, np.searchsorted(seen, new), new) if len(new) else seen
+
+class RepeatIndex:
+    """Seen-set of (Device Name, Domain) pairs for `Is_Repeat` tagging.
+
+    Pairs are kept as sorted unique hashes per ingested file (in registry order) plus their running union,
+    so tagging a new sheet is a vectorized lookup over its own rows and a removal only revisits later files.
+    """
+    def __init__(self):
+        self.by_file = {}
+        self.seen = _EMPTY
+
+    def contains(self, hashes):
+        return _member(self.seen, hashes)
+
+    def add(self, file_id, hashes):
+        uniq = np.unique(hashes)
+        self.by_file[file_id] = _merge(self.by_file[file_id], uniq) if file_id in self.by_file else uniq
+        self.seen = _merge(self.seen, uniq)
+
+    def fork(self):
+        """An independent index sharing this one's arrays (they are replaced, never written in place)."""
+        other = RepeatIndex()
+        other.by_file, other.seen = dict(self.by_file), self.seen
+        return other
+
+    def remove(self, file_id, parts):
+        """Forget a file's pairs and return {file_id: repaired Is_Repeat} for the partitions ingested after it.
+
+        `parts` maps file ids to their frames. Only rows already flagged as repeats whose pair the removed file
+        contained can flip, so each later partition re-checks just those rows against the pairs seen before it;
+        partitions with no flips are left out of the result.
+        """
+        if file_id not in self.by_file: return {}
+        with span('repeat.repair', file=file_id) as s:
+            changed, s['rows'] = self._repair(file_id, parts)
+        return changed
+
+    def _repair(self, file_id, parts):
+        ids = list(self.by_file)
+        pos = ids.index(file_id)
+        removed = self.by_file.pop(file_id)
+        seen = np.unique(np.concatenate([self.by_file[f] for f in ids[:pos]] or [_EMPTY]))
+        changed, checked = {}, 0
+        for fid in ids[pos + 1:]:
+            part = parts.get(fid)
+            if part is not None and len(removed) and 'Is_Repeat' in part.columns:
+                flags = part['Is_Repeat'].to_numpy(dtype=bool).copy()
+                rows = np.flatnonzero(flags)
+                checked += len(rows)
+                hashes = pair_hashes(part.reindex(columns=REPEAT_KEYS).iloc[rows])
+                stale = _member(removed, hashes)
+                if stale.any():
+                    flags[rows[stale]] = _member(seen, hashes[stale])
+                    changed[fid] = flags
+            seen = _merge(seen, self.by_file[fid])
+        self.seen = seen
+        return changed, checked
+
+# --- 2. MASTER STORE: SCHEMA REGISTRY + GROWABLE COLUMN BUFFERS ---
+# Every column lives in one preallocated numpy buffer that grows geometrically, so appending a file copies only its own rows.
+# Text columns are stored as category codes against grow-only categories; the combined view wraps the buffers without copying.
+GROWTH = 1.5
+MIN_CAPACITY = 1 << 16
+_FILL = {'float': np.nan, 'bool': False, 'datetime': np.datetime64('NaT', 'ns'), 'category': -1}
+
+def _code_dtype(n_categories):
+    """Smallest code dtype pandas itself would use for `n_categories`, so views can wrap the buffer as-is."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max: return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+class SchemaRegistry:
+    """Master-DB columns in first-seen order with their storage kind: float, bool, datetime or category (codes + categories).
+
+    The registry only grows; a file without some column gets that column's null fill for its rows.
+    """
+    KINDS = {'Count': 'float', 'Is_Repeat': 'bool', 'is_blocked': 'bool', 'Processed_Date': 'datetime'}
+
+    def __init__(self):
+        self.kinds = {}
+
+    def register(self, columns):
+        """Record unseen columns; returns the newly added ones."""
+        new = [col for col in columns if col not in self.kinds]
+        for col in new: self.kinds[col] = self.KINDS.get(col, 'category')
+        return new
+
+    def empty(self, col, capacity):
+        kind = self.kinds[col]
+        dtype = {'float': np.float64, 'bool': np.bool_, 'datetime': 'datetime64[ns]', 'category': np.int8}[kind]
+        return np.full(capacity, _FILL[kind], dtype=dtype)
+
+class PartitionedDB:
+    """`monthly_db` as growable column buffers with one row range per ingested file, keyed by `_file_id` in ingest order.
+
+    `add` writes only the new file's rows (amortized O(new rows)); `drop` just forgets the range and repairs
+    later files' `Is_Repeat`. `frame()` is a zero-copy view over the live rows, consolidating dropped ranges away
+    first when there are any.
+    """
+    def __init__(self):
+        self.schema = SchemaRegistry()
+        self.ranges = {}
+        self.categories = {}
+        self._bufs = {}
+        self._capacity = 0
+        self._rows = 0   # rows written, including dropped ranges not yet consolidated
+        self._dead = 0
+        self._view = None
+        self._shared = False  # buffers also referenced by a fork: copy before writing rows in place
+
+    def __len__(self):
+        return self._rows - self._dead
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def _reserve(self, rows):
+        if rows <= self._capacity: return
+        capacity = max(rows, int(self._capacity * GROWTH), MIN_CAPACITY)
+        for col, buf in self._bufs.items():
+            grown = np.empty(capacity, dtype=buf.dtype)
+            grown[:self._rows] = buf[:self._rows]
+            self._bufs[col] = grown
+        self._capacity = capacity
+
+    def fork(self):
+        """A copy-on-write clone: both sides share the buffers until one of them appends."""
+        other = copy.copy(self)
+        other.schema = SchemaRegistry()
+        other.schema.kinds = dict(self.schema.kinds)
+        other.ranges, other.categories, other._bufs = dict(self.ranges), dict(self.categories), dict(self._bufs)
+        self._shared = other._shared = True
+        return other
+
+    def _own(self):
+        if self._shared: self._bufs = {col: buf.copy() for col, buf in self._bufs.items()}
+        self._shared = False
+
+    def _encode(self, col, values, out):
+        """Write `values` as codes into `out`, extending the column's categories with unseen values."""
+        codes, uniques = pd.factorize(values.astype(object) if isinstance(values.dtype, pd.CategoricalDtype) else values)
+        cats = self.categories.get(col, pd.Index([], dtype=object))
+        idx = cats.get_indexer(uniques)
+        if (idx < 0).any():
+            cats = cats.append(pd.Index(np.asarray(uniques, dtype=object)[idx < 0], dtype=object))
+            self.categories[col] = cats
+            idx = cats.get_indexer(uniques)
+            if _code_dtype(len(cats)) != self._bufs[col].dtype: self._bufs[col] = self._bufs[col].astype(_code_dtype(len(cats)))
+        self._bufs[col][out] = np.append(idx, -1)[codes]
+
+    def add(self, file_id, df):
+        if df.empty: return
+        if file_id in self.ranges: self.drop(file_id)
+        self._own()
+        self._reserve(self._rows + len(df))
+        for col in self.schema.register(df.columns): self._bufs[col] = self.schema.empty(col, self._capacity)
+        rows = slice(self._rows, self._rows + len(df))
+        for col, kind in self.schema.kinds.items():
+            if col not in df.columns: self._bufs[col][rows] = _FILL[kind]
+            elif kind == 'category': self._encode(col, df[col], rows)
+            elif kind == 'float': self._bufs[col][rows] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+            elif kind == 'bool': self._bufs[col][rows] = df[col].fillna(False).to_numpy(dtype=bool)
+            else: self._bufs[col][rows] = pd.to_datetime(df[col]).to_numpy(dtype='datetime64[ns]')
+        self.ranges[file_id] = (rows.start, rows.stop)
+        self._rows = rows.stop
+        self._view = None
+
+    def partition(self, file_id):
+        """Zero-copy frame over one file's rows."""
+        return self._frame(*self.ranges[file_id])
+
+    def drop(self, file_id, index=None):
+        """Forget one file's rows; with `index`, repair `Is_Repeat` on the files ingested after it."""
+        if index is not None:
+            changed = index.remove(file_id, {fid: self.partition(fid) for fid in self.ranges if fid != file_id})
+            if changed:
+                flags = self._bufs['Is_Repeat'].copy()  # views handed out earlier keep their flags
+                for fid, new in changed.items(): flags[slice(*self.ranges[fid])] = new
+                self._bufs['Is_Repeat'] = flags
+        if file_id not in self.ranges: return
+        start, stop = self.ranges.pop(file_id)
+        self._dead += stop - start
+        self._view = None
+
+    def consolidate(self):
+        """Compact live rows to the front of fresh buffers, dropping the ranges of removed files."""
+        if not self._dead: return
+        keep = np.concatenate([np.arange(start, stop) for start, stop in self.ranges.values()] or [np.empty(0, dtype=np.int64)])
+        capacity = max(len(keep), MIN_CAPACITY)
+        for col, buf in self._bufs.items():
+            fresh = np.empty(capacity, dtype=buf.dtype)
+            fresh[:len(keep)] = buf[keep]
+            self._bufs[col] = fresh
+        self._shared = False
+        pos = 0
+        for fid, (start, stop) in self.ranges.items():
+            self.ranges[fid] = (pos, pos + stop - start)
+            pos += stop - start
+        self._capacity, self._rows, self._dead = capacity, len(keep), 0
+
+    def _frame(self, start, stop):
+        cols = {}
+        for col, kind in self.schema.kinds.items():
+            values = self._bufs[col][start:stop]
+            if kind == 'category': values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(self.categories.get(col, pd.Index([], dtype=object))), validate=False)
+            cols[col] = values
+        return pd.DataFrame(cols, copy=False)
+
+    def frame(self):
+        """The master DB as one DataFrame (cached until the next add/drop)."""
+        if self._view is None:
+            with span('db.combine', partitions=len(self.ranges), rows=len(self)):
+                self.consolidate()
+                self._view = self._frame(0, self._rows)
+        return self._view
+
+def memory_report(df):
+    """Deep memory usage of a frame: total bytes, bytes per row and a per-column breakdown."""
+    per_col = df.memory_usage(deep=True, index=False)
+    total = int(per_col.sum())
+    return {'rows': len(df), 'bytes': total, 'bytes_per_row': round(total / len(df), 1) if len(df) else 0.0, 'columns': {c: int(b) for c, b in per_col.items()}}
+
+# --- 3. PERSISTED MASTER STORE (OPTIONAL, NEEDS PYARROW) ---
+DERIVED_COLUMNS = ['Is_Repeat', 'is_blocked', 'category', 'country_class']  # mirrors analytics.CLASS_COLUMNS
+
+def arrow_safe(df):
+    """Shallow copy of `df` that Arrow can write: a text column mixing value types (e.g. 53 and '-') becomes strings.
+
+    Only the column's unique values (a categorical's whole category set, which Arrow writes as its dictionary) are
+    test-converted, so uniform columns (all str, all numeric, ...) keep their type.
+    """
+    import pyarrow as pa
+    out = df.copy(deep=False)
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype): codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        elif values.dtype == object: codes, uniques = pd.factorize(values)
+        else: continue
+        try: pa.array(np.asarray(uniques, dtype=object), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            out[col] = np.append(np.array([str(u) for u in uniques], dtype=object), None)[codes]
+    return out
+
+class ParquetStore:
+    """Append-only Parquet copy of `monthly_db`, partitioned as date=YYYY-MM-DD/device=<name>/<file key>.parquet.
+
+    `registry.json` keeps the file registry in ingest order together with each file's partition paths,
+    so a removal only unlinks that file's parts. Text columns mixing value types are stored as strings (`arrow_safe`).
+    Derived columns are not persisted: `Is_Repeat` is re-tagged here
+    on load and the classification columns are recomputed by the caller, so rule changes apply to stored data.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.registry_path = os.path.join(root, 'registry.json')
+
+    def _read_registry(self):
+        if not os.path.exists(self.registry_path): return []
+        with open(self.registry_path) as fh: return json.load(fh)
+
+    def _write_registry(self, entries):
+        tmp = self.registry_path + '.tmp'
+        with open(tmp, 'w') as fh: json.dump(entries, fh, indent=1)
+        os.replace(tmp, self.registry_path)
+
+    def version(self):
+        """Changes whenever the registry is rewritten; a cache key for snapshots returned by `load`."""
+        try: info = os.stat(self.registry_path)
+        except FileNotFoundError: return None
+        return info.st_mtime_ns, info.st_size
+
+    def append(self, entry, df):
+        """Write one log's partitions and registry entry; a log without rows (no sheet had `Status`) only gets the entry."""
+        key = hashlib.sha1(entry['id'].encode()).hexdigest()[:16]
+        parts = []
+        try:
+            for (day, dev), part in () if df.empty else arrow_safe(df.drop(columns=DERIVED_COLUMNS, errors='ignore')).groupby(['Processed_Date', 'Device Name'], observed=True, dropna=False, sort=False):
+                dev_dir = '__null__' if pd.isna(dev) else quote(str(dev), safe='')
+                rel = os.path.join(f"date={pd.Timestamp(day).date().isoformat()}", f"device={dev_dir}", f"{key}.parquet")
+                os.makedirs(os.path.join(self.root, os.path.dirname(rel)), exist_ok=True)
+                part.to_parquet(os.path.join(self.root, rel), index=False, engine='pyarrow')
+                parts.append(rel)
+        except Exception:
+            self._unlink(parts)  # no half-written log: the registry never saw these parts
+            raise
+        entries = [e for e in self._read_registry() if e['id'] != entry['id']]
+        entries.append({'id': entry['id'], 'filename': entry['filename'], 'date': str(entry['date']), 'sha': entry.get('sha'), 'parts': parts})
+        self._write_registry(entries)
+
+    def _unlink(self, parts):
+        for rel in parts:
+            path = os.path.join(self.root, rel)
+            if os.path.exists(path): os.remove(path)
+            for d in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+                if os.path.isdir(d) and not os.listdir(d): os.rmdir(d)
+
+    def remove(self, file_id):
+        entries = self._read_registry()
+        for e in entries:
+            if e['id'] == file_id: self._unlink(e['parts'])
+        self._write_registry([e for e in entries if e['id'] != file_id])
+
+    def load(self, prepare=None):
+        """Return (file_registry, PartitionedDB, repeat_index) rebuilt from every stored partition.
+
+        This reads the whole store, so callers share one result per `version()` and hand each user a `fork()`.
+        `prepare(frame)` runs on each file's rows before they are stored (the app passes its classifier).
+        """
+        import pyarrow.parquet as pq
+        registry, db, index = [], PartitionedDB(), RepeatIndex()
+        for e in self._read_registry():
+            tables = [pq.read_table(os.path.join(self.root, rel)) for rel in e['parts'] if os.path.exists(os.path.join(self.root, rel))]
+            df = pd.concat([t.to_pandas() for t in tables], ignore_index=True) if tables else pd.DataFrame()
+            if not df.empty:
+                hashes = pair_hashes(df)
+                df['Is_Repeat'] = index.contains(hashes)
+                index.add(e['id'], hashes)
+                db.add(e['id'], prepare(df) if prepare else df)
+            registry.append({'filename': e['filename'], 'date': date.fromisoformat(e['date']), 'id': e['id'], 'sha': e.get('sha')})
+        return registry, db, index
+
+def open_store(root=None):
+    """The persisted store configured by SHIELD_STORE_DIR, or None when unset or pyarrow is unavailable."""
+    root = root or os.environ.get('SHIELD_STORE_DIR')
+    if not root: return None
+    try: import pyarrow  # noqa: F401
+    except ImportError: return None
+    return ParquetStore(root)
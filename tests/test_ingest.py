@@ -0,0 +1,98 @@
+"""Reader invariants: the parse cache's pickle-free value encoding and the zip-level header probe agreeing with openpyxl.
+
+Run from the repository root: python -m pytest tests
+"""
+import io
+import os
+import sys
+import zipfile
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+from ingest import ParseCache, probe_sheets
+
+UNIQUES = ['Blocked', '', 'Zürich ✓', 53, -(2 ** 40), 1.5, float('inf'), True, False, datetime(2024, 1, 2, 3, 4, 5, 678901),
+           date(2024, 2, 29), time(23, 59, 59, 1), timedelta(days=-1, seconds=5, microseconds=7)]
+
+def _sheets():
+    codes = np.array([0, 3, -1, *range(len(UNIQUES))], dtype=np.int32)
+    return [('Sheet1', {'Status': (codes, np.array(UNIQUES, dtype=object)), 'Count': np.array([1.0, np.nan, 3.0])}),
+            ('Empty', {'Risk Reason': (np.full(4, -1, dtype=np.int32), np.array([], dtype=object))})]  # an all-null column
+
+def test_parse_cache_round_trips_every_value_type(tmp_path):
+    cache = ParseCache(str(tmp_path), max_bytes=1 << 30)
+    cache.put('k', _sheets())
+    got = cache.get('k')
+    assert [name for name, _ in got] == ['Sheet1', 'Empty']
+    codes, uniques = got[0][1]['Status']
+    assert codes.tolist() == _sheets()[0][1]['Status'][0].tolist()
+    assert [(type(v), v) for v in uniques] == [(type(v), v) for v in UNIQUES]
+    assert np.array_equal(got[0][1]['Count'], [1.0, np.nan, 3.0], equal_nan=True)
+    codes, uniques = got[1][1]['Risk Reason']
+    assert codes.tolist() == [-1] * 4 and len(uniques) == 0
+    assert ingest._unpack(got[1][1])['Risk Reason'].isna().all()
+
+def test_parse_cache_misses_on_another_format(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path), max_bytes=1 << 30)
+    cache.put('k', _sheets())
+    monkeypatch.setattr(ingest, 'PARSE_FORMAT', 'otherformat')
+    assert cache.get('k') is None
+    assert cache.get('absent') is None
+
+# --- header probe ---
+# Workbooks are written by hand so each header encoding (shared, inline, rich text) appears exactly as specified.
+NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+def _cell(ref, value):
+    if isinstance(value, int): return f'<c r="{ref}" t="s"><v>{value}</v></c>'  # index into the shared strings
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{value}</t></is></c>'
+
+def _xlsx(sheets, shared):
+    """Workbook bytes; `sheets` is [(name, first row number, header values)], ints being shared-string indices."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/><Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+                    + ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                              for i in range(1, len(sheets) + 1)) + '</Types>')
+        zf.writestr('_rels/.rels', f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    f'<Relationship Id="rId1" Type="{REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        zf.writestr('xl/workbook.xml', f'<?xml version="1.0" encoding="UTF-8"?><workbook {NS} xmlns:r="{REL}"><sheets>'
+                    + ''.join(f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, (name, _, _) in enumerate(sheets, 1)) + '</sheets></workbook>')
+        zf.writestr('xl/_rels/workbook.xml.rels', '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    + ''.join(f'<Relationship Id="rId{i}" Type="{REL}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(sheets) + 1))
+                    + f'<Relationship Id="rId{len(sheets) + 1}" Type="{REL}/sharedStrings" Target="sharedStrings.xml"/></Relationships>')
+        zf.writestr('xl/sharedStrings.xml', f'<?xml version="1.0" encoding="UTF-8"?><sst {NS} count="{len(shared)}" uniqueCount="{len(shared)}">{"".join(shared)}</sst>')
+        for i, (_, row, header) in enumerate(sheets, 1):
+            cells = ''.join(_cell(f"{'ABCDEFGH'[j]}{row}", v) for j, v in enumerate(header))
+            body = f'<row r="{row + 1}"><c r="A{row + 1}" t="inlineStr"><is><t>x</t></is></c></row>'
+            zf.writestr(f'xl/worksheets/sheet{i}.xml', f'<?xml version="1.0" encoding="UTF-8"?><worksheet {NS}><sheetData><row r="{row}">{cells}</row>{body}</sheetData></worksheet>')
+    return buf.getvalue()
+
+def _openpyxl_has_status(data):
+    from openpyxl import load_workbook
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        return [(ws.title, 'Status' in [str(h).strip() if h is not None else '' for h in next(ws.iter_rows(max_row=1, values_only=True), None) or ()])
+                for ws in wb.worksheets]
+    finally:
+        wb.close()
+
+def test_probe_sheets_agrees_with_openpyxl():
+    pytest.importorskip('openpyxl')
+    shared = ['<si><t>Domain</t></si>', '<si><t>Status</t></si>', '<si><r><t>Sta</t></r><r><rPr><b/></rPr><t>tus</t></r></si>',
+              '<si><t xml:space="preserve"> Status </t></si>', '<si><t>Statuses</t></si>']
+    sheets = [('shared', 1, [0, 1]), ('inline', 1, ['Domain', 'Status']), ('rich', 1, [0, 2]), ('padded', 1, [3, 0]),
+              ('padded_inline', 1, [' Status ']), ('no_status', 1, [0, 4, 'Count']), ('row_two', 2, [1, 0])]
+    data = _xlsx(sheets, shared)
+    expected = _openpyxl_has_status(data)
+    assert probe_sheets(data) == expected
+    assert [ok for _, ok in expected] == [True, True, True, True, True, False, False]
@@ -0,0 +1,102 @@
+"""Master-store invariants: incremental Is_Repeat repair, code-width growth, schema fill and the Parquet round trip.
+
+Run from the repository root: python -m pytest tests
+"""
+import os
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import compile_sheets
+from store import ParquetStore, PartitionedDB, RepeatIndex, arrow_safe
+
+def _sheet(devices, domains):
+    n = len(domains)
+    return pd.DataFrame({'Status': ['Blocked', 'Allowed'] * (n // 2) + ['Blocked'] * (n % 2), 'Device Name': devices, 'Domain': domains,
+                         'Count': np.arange(1, n + 1), 'Server Country': 'Germany', 'DNS Answers': '10.0.0.1'})
+
+# Overlapping (device, domain) pairs, so later days carry repeats that depend on which earlier days are present.
+DAYS = [
+    ('d1', date(2024, 1, 1), _sheet(['s1', 's1', 's2', 's2'], ['a.com', 'b.com', 'a.com', 'c.com'])),
+    ('d2', date(2024, 1, 2), _sheet(['s1', 's2', 's2', 's3'], ['a.com', 'c.com', 'd.com', 'e.com'])),
+    ('d3', date(2024, 1, 3), _sheet(['s1', 's2', 's3', 's3', 's1'], ['b.com', 'd.com', 'e.com', 'f.com', 'a.com'])),
+    ('d4', date(2024, 1, 4), _sheet(['s2', 's3', 's1'], ['c.com', 'f.com', 'g.com'])),
+]
+
+def _compile(days):
+    index, db = RepeatIndex(), PartitionedDB()
+    for fid, day, sheet in days:
+        db.add(fid, compile_sheets([('Sheet1', sheet.copy())], fid, day, index))
+    return index, db
+
+def _same_rows(a, b):
+    cols = list(b.columns)
+    return a[cols].astype(object).reset_index(drop=True).equals(b.astype(object).reset_index(drop=True))
+
+def test_drop_middle_file_matches_recompile():
+    index, db = _compile(DAYS)
+    before = db.frame()
+    db.drop('d2', index)
+    _, ref = _compile([d for d in DAYS if d[0] != 'd2'])
+    assert _same_rows(db.frame(), ref.frame())
+    assert db.frame()['Is_Repeat'].sum() < before[before['_file_id'] != 'd2']['Is_Repeat'].sum()  # the repair flipped rows
+    assert before['Is_Repeat'].sum() == _compile(DAYS)[1].frame()['Is_Repeat'].sum()  # views handed out earlier keep their flags
+
+def test_categories_grow_from_int8_to_int16_codes():
+    db = PartitionedDB()
+    db.add('small', pd.DataFrame({'Domain': ['x', 'y'], 'Count': [1, 2]}))
+    assert db._bufs['Domain'].dtype == np.int8
+    domains = [f"host{i}.example" for i in range(300)]
+    db.add('big', pd.DataFrame({'Domain': domains, 'Count': range(300)}))
+    assert db._bufs['Domain'].dtype == np.int16
+    view = db.frame()
+    assert view['Domain'].cat.codes.dtype == np.int16
+    assert view['Domain'].tolist() == ['x', 'y'] + domains
+
+def test_missing_registered_column_gets_null_fill():
+    db = PartitionedDB()
+    db.add('f1', pd.DataFrame({'Domain': ['a'], 'Count': [1], 'Risk Reason': ['malware'], 'Is_Repeat': [True]}))
+    db.add('f2', pd.DataFrame({'Domain': ['b', 'c'], 'Count': [2, 3]}))
+    view = db.frame()
+    assert list(view.columns) == ['Domain', 'Count', 'Risk Reason', 'Is_Repeat']
+    assert view['Risk Reason'].isna().tolist() == [False, True, True]
+    assert view['Is_Repeat'].tolist() == [True, False, False]
+    assert db.partition('f2')['Count'].tolist() == [2.0, 3.0]
+
+def test_fork_is_copy_on_write():
+    _, db = _compile(DAYS[:2])
+    fork = db.fork()
+    fid, day, sheet = DAYS[2]
+    fork.add(fid, compile_sheets([('Sheet1', sheet.copy())], fid, day, RepeatIndex()))
+    assert len(fork) == len(db) + len(sheet)
+    assert _same_rows(db.frame(), _compile(DAYS[:2])[1].frame())
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    store, index = ParquetStore(str(tmp_path)), RepeatIndex()
+    days = [(fid, day, sheet.assign(Port=[53, '-', 80, 53, '-']) if fid == 'd3' else sheet) for fid, day, sheet in DAYS]  # ints and text, as openpyxl reads them
+    for fid, day, sheet in days:
+        store.append({'id': fid, 'filename': f"{fid}.xlsx", 'date': day, 'sha': fid}, compile_sheets([('Sheet1', sheet.copy())], fid, day, index))
+    store.append({'id': 'no_status', 'filename': 'summary.xlsx', 'date': date(2024, 1, 9)}, pd.DataFrame())  # a log without rows
+    store.remove('d2')
+    registry, db, loaded_index = store.load()
+    assert [e['id'] for e in registry] == ['d1', 'd3', 'd4', 'no_status']
+    ref_index, ref = _compile([d for d in days if d[0] != 'd2'])
+    stored = ref.frame().drop(columns=['is_blocked', 'category', 'country_class'])
+    stored['Port'] = [v if pd.isna(v) else str(v) for v in stored['Port'].astype(object)]  # mixed-type columns are stored as strings
+    order = ['_file_id', 'Count']  # partitions are per device, so rows come back grouped by device within each file
+    assert _same_rows(db.frame().sort_values(order), stored.sort_values(order))
+    assert np.array_equal(loaded_index.seen, ref_index.seen)
+
+def test_arrow_safe_checks_all_categories():
+    pa = pytest.importorskip('pyarrow')
+    window = pd.DataFrame({'Port': pd.Categorical([53, '-', 80, None]), 'Domain': pd.Categorical(['a', 'b', 'a', 'b'])}).iloc[[0, 2, 3]]  # '-' only in the dictionary
+    out = arrow_safe(window)
+    assert out['Port'].tolist()[:2] == ['53', '80'] and pd.isna(out['Port'].iloc[2])
+    assert isinstance(out['Domain'].dtype, pd.CategoricalDtype)
+    pa.Table.from_pandas(out)